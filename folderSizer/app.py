@@ -1,193 +1,423 @@
+import math
+import multiprocessing
 import os
+import sys
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from pathlib import Path
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tkinter import Tk, filedialog, Button
+import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.backend_bases import MouseEvent
-
-
-def get_total_folder_size(path, max_depth=1):
-    total_size = 0
-    start_time = time.time()
-
-    try:
-        for item in path.iterdir():
-            if item.is_file():
-                total_size += item.stat().st_size
-            elif item.is_dir():
-                total_size += analyze_subfolder(item, max_depth)
-    except (PermissionError, FileNotFoundError):
-        print(f"Skipping inaccessible folder: {path}")
-
-    elapsed_time = time.time() - start_time
-    if elapsed_time > 3:
-        print(f"Splitting analysis for: {path}")
-        total_size = split_analysis(path, max_depth + 1)
-
-    return total_size
-
-
-def analyze_subfolder(folder, max_depth=1):
-    total_size = 0
+from matplotlib.collections import PolyCollection
+
+
+PLOT_REFRESH_INTERVAL = 0.5
+LARGE_PLOT_THRESHOLD = 512
+
+SIZE_UNITS = [(1, 'B'), (1024, 'KB'), (1048576, 'MB'), (1073741824, 'GB'), (1099511627776, 'TB')]
+
+
+if os.scandir in os.supports_fd:
+    @contextmanager
+    def open_folder(path):
+        # Listing through a directory fd makes DirEntry.stat() a relative
+        # fstatat(), so the kernel does not re-resolve the full path per file.
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            with os.scandir(fd) as it:
+                yield it
+        finally:
+            os.close(fd)
+else:
+    # On Windows, os.scandir is backed by FindFirstFileW/FindNextFileW and
+    # DirEntry.stat(follow_symlinks=False) is filled from that find data,
+    # so file sizes already cost no extra system call per entry.
+    open_folder = os.scandir
+
+
+def analyze_folder(path, dir_cache=None, log=None, denied=None):
+    root = os.fspath(path)
+    own_sizes = {}
+    parents = {root: None}
+    mtimes = {}
+    cached_totals = {}
+
+    if dir_cache is not None:
+        try:
+            mtimes[root] = os.stat(root).st_mtime_ns
+        except OSError:
+            pass
+
+    # The per-entry loop below is the hot path; bind the lookups it repeats.
+    join = os.path.join
+    queue = deque([root])
+    enqueue = queue.append
+    track_mtimes = dir_cache is not None
+    while queue:
+        current = queue.popleft()
+        cached = dir_cache.get(current) if dir_cache is not None else None
+        if cached is not None and cached[0] == mtimes.get(current):
+            own_sizes[current] = cached[1]
+            cached_totals[current] = cached[2]
+            continue
+        if denied is not None and current in denied:
+            own_sizes[current] = 0
+            continue
+
+        own_size = 0
+        with ExitStack() as stack:
+            # Only failing to open the folder marks it denied; errors while
+            # listing it just end the listing early.
+            try:
+                it = stack.enter_context(open_folder(current))
+            except (PermissionError, FileNotFoundError):
+                if denied is not None:
+                    denied.add(current)
+                if log is not None:
+                    log.append(f"Skipping inaccessible folder: {current}")
+                it = ()
+            except OSError:
+                it = ()
+            try:
+                for entry in it:
+                    try:
+                        if entry.is_file(follow_symlinks=False):
+                            own_size += entry.stat(follow_symlinks=False).st_size
+                        elif entry.is_dir(follow_symlinks=False):
+                            child = join(current, entry.name)
+                            if track_mtimes:
+                                mtimes[child] = entry.stat(follow_symlinks=False).st_mtime_ns
+                            parents[child] = current
+                            enqueue(child)
+                    except OSError:
+                        continue
+            except OSError:
+                pass
+        own_sizes[current] = own_size
+
+    # Folders are popped parent-first, so walking them in reverse rolls each
+    # subtree total up into its parent only once it is complete.
+    totals = {folder: cached_totals.get(folder, size) for folder, size in own_sizes.items()}
+    for folder in reversed(own_sizes):
+        parent = parents[folder]
+        if parent is not None:
+            totals[parent] += totals[folder]
+
+    if dir_cache is not None:
+        for folder, total in totals.items():
+            if folder in mtimes:
+                dir_cache[folder] = (mtimes[folder], own_sizes[folder], total)
+
+    return path, own_sizes[root], totals[root]
+
+
+def scan_folder(path, denied=frozenset()):
+    # Runs in a worker process, so the cache entries, log lines and newly
+    # denied folders it finds are handed back to the parent instead of being
+    # written to shared state.
+    dir_cache = {}
+    log = []
+    known_denied = set(denied)
+    path, files_size, total_size = analyze_folder(path, dir_cache, log, known_denied)
+    return path, files_size, total_size, dir_cache, log, known_denied - denied
+
+
+def scan_folders(paths, denied=frozenset()):
+    return [scan_folder(path, denied) for path in paths]
+
+
+def analyze_files_in_directory(path, log=None, denied=None):
+    names = []
+    sizes = []
+    if denied is not None and path in denied:
+        return names, np.asarray(sizes, dtype=np.int64)
     try:
-        for item in folder.rglob('*'):
-            if item.is_file():
-                total_size += item.stat().st_size
+        it = os.scandir(path)
     except (PermissionError, FileNotFoundError):
-        print(f"Skipping inaccessible folder: {folder}")
-    return total_size
-
-
-def split_analysis(path, max_depth):
-    total_size = 0
-    with ThreadPoolExecutor() as executor:
-        futures = [executor.submit(analyze_subfolder, subfolder, max_depth)
-                   for subfolder in path.iterdir() if subfolder.is_dir()]
-
-        for future in as_completed(futures):
-            total_size += future.result()
-
-    return total_size
-
-
-def analyze_folder(path):
-    total_size = 0
-    files_size = 0
-    try:
-        files_size = sum(item.stat().st_size for item in path.iterdir() if item.is_file())
-        subfolder_size = get_total_folder_size(path)
-        total_size = subfolder_size
-    except (PermissionError, FileNotFoundError):
-        print(f"Skipping inaccessible folder: {path}")
-
-    return path, files_size, total_size
-
-
-def analyze_files_in_directory(path):
-    files_info = {}
-    try:
-        for file in path.iterdir():
-            if file.is_file():
-                files_info[file] = file.stat().st_size
-    except (PermissionError, FileNotFoundError):
-        print(f"Skipping inaccessible file: {file}")
-    return files_info
+        if denied is not None:
+            denied.add(path)
+        if log is not None:
+            log.append(f"Skipping inaccessible folder: {path}")
+        return names, np.asarray(sizes, dtype=np.int64)
+    with it:
+        for entry in it:
+            try:
+                if entry.is_file(follow_symlinks=False):
+                    size = entry.stat(follow_symlinks=False).st_size
+                    names.append(entry.name)
+                    sizes.append(size)
+            except OSError:
+                continue
+    return names, np.asarray(sizes, dtype=np.int64)
 
 
 def format_size(size):
-    if size < 1024:
-        return f"{size} B"
-    elif size < 1048576:
-        return f"{size // 1024} KB"
-    elif size < 1073741824:
-        return f"{size // 1048576} MB"
-    else:
-        return f"{size // 1073741824} GB"
+    # (bit_length - 1) // 10 is the power of 1024 the size falls under.
+    div, suffix = SIZE_UNITS[min(max(size.bit_length() - 1, 0) // 10, len(SIZE_UNITS) - 1)]
+    return f"{size // div} {suffix}"
 
 
 def analyze_and_plot(target_dir, max_workers=8):
-    path = Path(target_dir)
-    if not path.exists() or not path.is_dir():
+    path = os.fspath(target_dir)
+    if not os.path.isdir(path):
         print("Directory does not exist.")
         return
 
-    folder_sizes = {}
-    files_sizes = {}
-    files_info = {}
+    subfolders = []
+    total_sizes = []
+    folder_labels = []
+    files_info = ([], np.empty(0, dtype=np.int64))
+    dir_cache = {}
+    # Folders that raised PermissionError/FileNotFoundError this session;
+    # they are not listed again when navigating back and forth.
+    denied = set()
     history = [path]
+    # Set while perform_analysis runs; partial redraws pump the GUI event
+    # loop, and navigating from inside it would re-enter the scan.
+    scanning = False
 
     def perform_analysis(directory):
-        nonlocal folder_sizes, files_sizes, files_info
-
-        folder_sizes.clear()
-        files_sizes.clear()
-        files_info.clear()
+        nonlocal files_info, scanning
+
+        subfolders.clear()
+        total_sizes.clear()
+        folder_labels.clear()
+        files_info = ([], np.empty(0, dtype=np.int64))
+        log_buf = []
+
+        def add_result(subfolder, file_size, total_size):
+            subfolders.append(subfolder)
+            total_sizes.append(total_size)
+            total_label = format_size(total_size)
+            name = os.path.basename(subfolder)
+            folder_labels.append(f"{name}\n{total_label}")
+            log_buf.append(f"{name} - Total: {total_label} | Files: {format_size(file_size)}")
+
+        def uncached_subfolders():
+            if directory in denied:
+                return
+            try:
+                it = os.scandir(directory)
+            except (PermissionError, FileNotFoundError):
+                denied.add(directory)
+                log_buf.append(f"Skipping inaccessible folder: {directory}")
+                return
+            with it:
+                for entry in it:
+                    try:
+                        if not entry.is_dir(follow_symlinks=False):
+                            continue
+                        if entry.path in denied:
+                            add_result(entry.path, 0, 0)
+                            continue
+                        cached = dir_cache.get(entry.path)
+                        cache_hit = cached is not None and cached[0] == entry.stat(follow_symlinks=False).st_mtime_ns
+                    except OSError:
+                        continue
+                    if cache_hit:
+                        add_result(entry.path, cached[1], cached[2])
+                    else:
+                        yield entry.path
+
+        def redraw():
+            plot_folder_sizes(ax, view, subfolders, np.array(total_sizes, dtype=np.int64), folder_labels,
+                              files_info)
 
         print(f"\nAnalyzing folder sizes in {directory}...\n")
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {executor.submit(analyze_folder, subfolder): subfolder
-                       for subfolder in directory.iterdir() if subfolder.is_dir()}
+        scanning = True
+        futures = []
+        try:
+            # Aim for about four tasks per worker: narrow folders get one
+            # subfolder per task so every worker is busy, and only very wide
+            # folders are grouped to avoid a future per child.
+            pending = list(uncached_subfolders())
+            batch_size = max(1, math.ceil(len(pending) / (max_workers * 4)))
+            known_denied = frozenset(denied)
+            for start in range(0, len(pending), batch_size):
+                futures.append(executor.submit(scan_folders, pending[start:start + batch_size], known_denied))
+
+            files_info = analyze_files_in_directory(directory, log_buf, denied)
+
+            # Show cached folders and top-level files straight away, then
+            # draw partial results in completion order while slower
+            # subfolders are still being scanned, throttled so redraws stay
+            # cheap on very wide folders.
+            redraw()
+            fig.canvas.flush_events()
+            last_draw = time.monotonic()
+            for future in as_completed(futures):
+                for subfolder, file_size, total_size, entries, log, newly_denied in future.result():
+                    dir_cache.update(entries)
+                    denied.update(newly_denied)
+                    log_buf.extend(log)
+                    add_result(subfolder, file_size, total_size)
+                if time.monotonic() - last_draw >= PLOT_REFRESH_INTERVAL:
+                    if not plt.fignum_exists(fig.number):
+                        return
+                    redraw()
+                    fig.canvas.flush_events()
+                    last_draw = time.monotonic()
+        finally:
+            for future in futures:
+                future.cancel()
+            scanning = False
+
+        if log_buf:
+            sys.stdout.write("\n".join(log_buf) + "\n")
+
+        if plt.fignum_exists(fig.number):
+            redraw()
 
-            files_info = analyze_files_in_directory(directory)
+    def go_back():
+        if not scanning and len(history) > 1:
+            history.pop()
+            perform_analysis(history[-1])
 
-            for future in as_completed(futures):
-                subfolder, file_size, total_size = future.result()
-                folder_sizes[subfolder] = total_size
-                files_sizes[subfolder] = file_size
-                print(f"{subfolder.name} - Total: {format_size(total_size)} | Files: {format_size(file_size)}")
+    def drill_down(folder):
+        if scanning:
+            return
+        history.append(folder)
+        perform_analysis(folder)
 
-        plot_folder_sizes(folder_sizes, files_sizes, files_info, directory, perform_analysis, history)
+    # One figure serves the whole session; navigating only redraws its axes.
+    fig, ax = plt.subplots(figsize=(12, 8))
+    view = {}
+    connect_plot_events(fig, view, go_back, drill_down, lambda: scanning)
+    plt.show(block=False)
 
-    perform_analysis(path)
+    # Worker processes are started once per session and reused on every
+    # navigation; with spawn each new worker re-imports this module.
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        perform_analysis(path)
+        plt.show()
+    finally:
+        # shutdown() on its own would still wait for batches already running
+        # when the window was closed mid-scan, so stop the workers outright.
+        executor.shutdown(wait=False, cancel_futures=True)
+        for worker in multiprocessing.active_children():
+            worker.terminate()
 
 
-def plot_folder_sizes(folder_sizes, files_sizes, files_info, target_dir, callback, history):
-    subfolders = list(folder_sizes.keys())
-    total_sizes = list(folder_sizes.values())
-    file_sizes = list(files_sizes.values())
+def plot_folder_sizes(ax, view, subfolders, total_sizes, folder_labels, files_info):
+    file_names, file_values = files_info
 
-    file_names = list(files_info.keys())
-    file_values = list(files_info.values())
+    total_dir_size = int(total_sizes.sum() + file_values.sum())
 
-    total_dir_size = sum(total_sizes) + sum(file_values)
+    # Tooltip text is built once here so mouse-move events only index into it.
+    labels = folder_labels + [
+        f"{name} - {format_size(size)} | {size / (total_dir_size or 1) * 100:.2f}% of total"
+        for name, size in zip(file_names, file_values.tolist())
+    ]
 
-    fig, ax = plt.subplots(figsize=(12, 8))
+    ax.clear()
     bar_width = 0.4
-    x_pos = range(len(subfolders) + len(file_names))
-
-    bars_total = ax.bar(x_pos[:len(subfolders)], total_sizes, width=bar_width, label='Folders', color='dodgerblue')
-    bars_files = ax.bar(x_pos[len(subfolders):], file_values, width=bar_width, label='Files', color='green')
+    x_pos = np.arange(len(subfolders) + len(file_names))
+
+    if len(x_pos) > LARGE_PLOT_THRESHOLD:
+        # Thousands of Rectangle patches and rotated tick labels make layout
+        # and drawing slow; draw each series as one collection and leave the
+        # names to the tooltip.
+        ax.add_collection(bar_collection(x_pos[:len(subfolders)], total_sizes, bar_width,
+                                         label='Folders', color='dodgerblue'))
+        ax.add_collection(bar_collection(x_pos[len(subfolders):], file_values, bar_width,
+                                         label='Files', color='green'))
+        ax.autoscale_view()
+        ax.set_ylim(bottom=0)
+        ax.set_xticks([])
+    else:
+        ax.bar(x_pos[:len(subfolders)], total_sizes, width=bar_width, label='Folders', color='dodgerblue')
+        ax.bar(x_pos[len(subfolders):], file_values, width=bar_width, label='Files', color='green')
 
-    plt.xticks(
-        x_pos,
-        [sf.name for sf in subfolders] + [f.name for f in file_names],
-        rotation=45,
-        ha="right"
-    )
-    plt.tight_layout()
+        ax.set_xticks(
+            x_pos,
+            [os.path.basename(p) for p in subfolders] + file_names,
+            rotation=45,
+            ha="right"
+        )
+    ax.figure.tight_layout()
 
     annot = ax.annotate("", xy=(0, 0), xytext=(10, 10),
                         textcoords="offset points", bbox=dict(boxstyle="round", fc="w"),
                         arrowprops=dict(arrowstyle="->"))
     annot.set_visible(False)
 
+    # Bars share one width at sorted x positions, so a bar is found by
+    # bisecting its left edge instead of asking every bar to hit-test.
+    view.update(
+        ax=ax,
+        annot=annot,
+        folders=list(subfolders),
+        bar_width=bar_width,
+        x_pos=x_pos,
+        left_edges=x_pos - bar_width / 2,
+        heights=np.concatenate((total_sizes, file_values)),
+        labels=labels,
+    )
+    ax.figure.canvas.draw_idle()
+
+
+def bar_collection(x, heights, width, **kwargs):
+    left = x - width / 2
+    right = x + width / 2
+    top = heights.astype(float)
+    bottom = np.zeros_like(top)
+    verts = np.stack([
+        np.column_stack((left, bottom)),
+        np.column_stack((left, top)),
+        np.column_stack((right, top)),
+        np.column_stack((right, bottom)),
+    ], axis=1)
+    return PolyCollection(verts, **kwargs)
+
+
+def connect_plot_events(fig, view, go_back, drill_down, is_scanning):
+    # Handlers stay connected for the figure's lifetime and read whatever
+    # plot_folder_sizes last stored in view.
+    def bar_at(event):
+        if not view or event.inaxes is not view["ax"] or event.xdata is None:
+            return -1
+        left_edges = view["left_edges"]
+        i = int(np.searchsorted(left_edges, event.xdata, side="right")) - 1
+        if (0 <= i < len(left_edges) and event.xdata <= left_edges[i] + view["bar_width"]
+                and 0 <= event.ydata <= view["heights"][i]):
+            return i
+        return -1
+
     def update_tooltip(event):
+        if not view:
+            return
+        annot = view["annot"]
         vis = annot.get_visible()
-        for i, bar in enumerate(bars_total + bars_files):
-            if bar.contains(event)[0]:
-                x = bar.get_x() + bar.get_width() / 2
-                y = bar.get_height()
-                annot.xy = (x, y)
-                if i < len(subfolders):
-                    label = subfolders[i].name
-                    size = total_sizes[i]
-                else:
-                    label = file_names[i - len(subfolders)].name
-                    size = file_values[i - len(subfolders)]
-                    percentage = (size / total_dir_size) * 100
-                    label += f" - {format_size(size)} | {percentage:.2f}% of total"
-                annot.set_text(label)
-                annot.set_visible(True)
-                fig.canvas.draw_idle()
-                return
-        if vis:
+        i = bar_at(event)
+        if i >= 0:
+            annot.xy = (view["x_pos"][i], view["heights"][i])
+            annot.set_text(view["labels"][i])
+            annot.set_visible(True)
+            fig.canvas.draw_idle()
+        elif vis:
             annot.set_visible(False)
             fig.canvas.draw_idle()
 
-    fig.canvas.mpl_connect("motion_notify_event", update_tooltip)
+    def on_button(event):
+        # The chart is only partially drawn while a scan is running.
+        if is_scanning():
+            return
+        if event.button == 3:
+            go_back()
+        elif event.button == 1:
+            i = bar_at(event)
+            if 0 <= i < len(view["folders"]):
+                drill_down(view["folders"][i])
 
-    def go_back():
-        if len(history) > 1:
-            history.pop()
-            plt.close(fig)
-            callback(history[-1])
+    fig.canvas.mpl_connect("motion_notify_event", update_tooltip)
+    fig.canvas.mpl_connect("button_press_event", on_button)
 
-    back_button = Button(plt.gcf().canvas.get_tk_widget(), text="..", command=go_back)
+    back_button = Button(fig.canvas.get_tk_widget(), text="..", command=go_back)
     back_button.place(x=10, y=10)
 
-    plt.show()
-
 
 if __name__ == "__main__":
     while True: